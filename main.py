@@ -0,0 +1,598 @@
+"""Broadcasting API server.
+
+Manages streaming rooms for the RTMP/HLS broadcasting setup: creates rooms
+with unique stream keys, hands out RTMP ingest and viewer URLs (plus a QR
+code for the viewer page), and keeps room state in sync via the NGINX-RTMP
+on_publish/on_publish_done webhooks.
+"""
+
+import asyncio
+import io
+import os
+import re
+import secrets
+import time
+import urllib.parse
+import uuid
+from collections import deque
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Deque, Dict, Optional, Tuple
+
+import anyio.to_thread
+import numpy as np
+import orjson
+import png
+import redis.asyncio as aioredis
+import segno
+import uvicorn
+from fastapi import FastAPI, Form, HTTPException
+from fastapi.responses import Response
+from pydantic import BaseModel, ConfigDict
+
+SERVER_HOST = os.environ.get("SERVER_HOST", "localhost")
+RTMP_PORT = int(os.environ.get("RTMP_PORT", "1935"))
+HTTP_PORT = int(os.environ.get("HTTP_PORT", "8000"))
+
+# Formatted once at import; identical for every room (and every request).
+RTMP_URL = f"rtmp://{SERVER_HOST}:{RTMP_PORT}/live"
+BASE_VIEWER_URL = f"http://{SERVER_HOST}:{HTTP_PORT}/watch"
+
+# When set, each room's QR PNG is written to this directory at creation and
+# qr_code points at QR_PUBLIC_BASE instead of the in-app endpoint, so NGINX
+# (sendfile) serves the image and Python drops out of that path entirely.
+QR_EXPORT_DIR = os.environ.get("QR_EXPORT_DIR")
+QR_PUBLIC_BASE = os.environ.get("QR_PUBLIC_BASE", "/qr")
+
+# When set, room state is written through to Redis and reloaded on startup,
+# so rooms and stream keys survive restarts. Reads stay on the in-process
+# dicts: with a single worker they are always current and a dict hit beats
+# a network round trip. Leave unset for purely in-memory operation.
+REDIS_URL = os.environ.get("REDIS_URL")
+
+ROOMS_KEY = "broadcasting:rooms"
+ACTIVE_STREAMS_KEY = "broadcasting:active_streams"
+
+redis_client: Optional[aioredis.Redis] = None
+
+
+async def _load_state() -> None:
+    """Rehydrate rooms_db and its derived indexes from Redis on startup."""
+    global active_count
+    for room_json in (await redis_client.hgetall(ROOMS_KEY)).values():
+        room = Room.model_validate_json(room_json)
+        rooms_db[room.room_id] = room
+        stream_key_index[room.stream_key] = room
+        if room.is_active:
+            active_count += 1
+    # Stream starts are persisted as wall-clock times; map them back onto
+    # this process's monotonic clock so uptime keeps counting correctly.
+    now_wall = datetime.now(timezone.utc)
+    now_mono = time.monotonic()
+    for stream_key, started in (await redis_client.hgetall(ACTIVE_STREAMS_KEY)).items():
+        elapsed = (now_wall - datetime.fromisoformat(started)).total_seconds()
+        active_streams[stream_key] = now_mono - elapsed
+
+
+async def _persist_room(room: "Room") -> None:
+    if redis_client is not None:
+        await redis_client.hset(ROOMS_KEY, room.room_id, room.model_dump_json())
+
+
+async def _persist_room_delete(room: "Room") -> None:
+    if redis_client is not None:
+        await redis_client.hdel(ROOMS_KEY, room.room_id)
+        await redis_client.hdel(ACTIVE_STREAMS_KEY, room.stream_key)
+
+
+async def _persist_stream_start(stream_key: str, started: datetime) -> None:
+    if redis_client is not None:
+        await redis_client.hset(ACTIVE_STREAMS_KEY, stream_key, started.isoformat())
+
+
+async def _persist_stream_end(stream_key: str) -> None:
+    if redis_client is not None:
+        await redis_client.hdel(ACTIVE_STREAMS_KEY, stream_key)
+
+
+# Pre-generated (room_id, stream_key) pairs so burst room creation pops
+# from a deque instead of hitting the kernel CSPRNG on the request path.
+_ID_POOL_SIZE = 512
+_id_pool: Deque[Tuple[str, str]] = deque()
+
+
+def _new_credentials() -> Tuple[str, str]:
+    return str(uuid.uuid4()), secrets.token_urlsafe(32)
+
+
+async def _refill_id_pool() -> None:
+    while True:
+        while len(_id_pool) < _ID_POOL_SIZE:
+            _id_pool.append(_new_credentials())
+        await asyncio.sleep(1.0)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global redis_client
+    if REDIS_URL:
+        redis_client = aioredis.from_url(REDIS_URL, decode_responses=True)
+        await _load_state()
+    refill_task = asyncio.create_task(_refill_id_pool())
+    yield
+    refill_task.cancel()
+    if redis_client is not None:
+        await redis_client.aclose()
+        redis_client = None
+
+
+_CORS_ALLOW_ORIGIN = (b"access-control-allow-origin", b"*")
+_CORS_PREFLIGHT_HEADERS = [
+    _CORS_ALLOW_ORIGIN,
+    (b"access-control-allow-methods", b"*"),
+    (b"access-control-allow-headers", b"*"),
+    (b"access-control-max-age", b"86400"),
+]
+
+
+class WildcardCORSMiddleware:
+    """Constant-header CORS for a fully wildcarded policy.
+
+    The stock CORSMiddleware walks its allow-lists on every request even
+    though this app permits everything. With a wildcard policy the headers
+    are the same constants every time: preflights get a canned 204 and
+    other responses get allow-origin appended, nothing else to compute.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        if scope["method"] == "OPTIONS":
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": 204,
+                    "headers": _CORS_PREFLIGHT_HEADERS,
+                }
+            )
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        async def send_with_cors(message):
+            if message["type"] == "http.response.start":
+                # Copy instead of extending in place: shared responses
+                # like STATUS_OK hand out the same raw header list on
+                # every request.
+                message = {
+                    **message,
+                    "headers": [*message.get("headers", ()), _CORS_ALLOW_ORIGIN],
+                }
+            await send(message)
+
+        await self.app(scope, receive, send_with_cors)
+
+
+app = FastAPI(
+    title="Broadcasting API",
+    lifespan=lifespan,
+)
+
+app.add_middleware(WildcardCORSMiddleware)
+
+
+class Room(BaseModel):
+    room_id: str
+    name: str
+    stream_key: str
+    rtmp_url: str
+    viewer_url: str
+    qr_code: str
+    created_at: datetime
+    is_active: bool = False
+    # Maintained by the HLS edge via the viewer_start/viewer_end webhooks.
+    viewer_count: int = 0
+
+
+class RoomCreate(BaseModel):
+    name: str
+
+
+class RoomResponse(BaseModel):
+    # from_attributes lets endpoints return the internal Room directly and
+    # have pydantic-core serialize it in Rust; frozen because responses
+    # are never mutated after construction.
+    model_config = ConfigDict(frozen=True, from_attributes=True)
+
+    room_id: str
+    name: str
+    rtmp_url: str
+    stream_key: str
+    viewer_url: str
+    qr_code: str
+    is_active: bool
+    viewer_count: int
+    created_at: datetime
+
+
+rooms_db: Dict[str, Room] = {}
+# Secondary index for the NGINX webhooks: stream_key -> Room, kept in sync
+# with rooms_db so publish/unpublish events resolve in O(1).
+stream_key_index: Dict[str, Room] = {}
+# stream_key -> time.monotonic() at publish; a bare float costs far less
+# per event than a datetime object and is immune to wall-clock jumps.
+active_streams: Dict[str, float] = {}
+# Live-room counter maintained by the webhooks so the health check never
+# scans rooms_db. Safe without a lock: handlers run on one event loop and
+# never await between read and write.
+active_count = 0
+
+# uuid4 shape of every room_id. Checking this before touching rooms_db
+# lets floods of probes for junk IDs fail on a compiled regex instead of
+# hashing attacker-chosen strings and building dict misses.
+_UUID_RE = re.compile(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}")
+
+# Serialized room-list response, rebuilt lazily on the first GET after a
+# mutation. Every write path that changes what list_rooms returns must
+# call _invalidate_rooms_list().
+_rooms_list_cache: Optional[bytes] = None
+
+# Serialized once at import; NGINX only checks the status code, and
+# Starlette writes a Response body without mutating it, so the webhooks
+# can share this single instance instead of re-encoding a dict per event.
+STATUS_OK = Response(content=b'{"status":"ok"}', media_type="application/json")
+
+
+QR_SCALE = 10
+QR_BORDER = 4
+
+
+@lru_cache(maxsize=2048)
+def generate_qr_code(url: str) -> bytes:
+    """Render ``url`` as a QR code and return the raw PNG bytes.
+
+    Viewer URLs are deterministic per room, so results are memoized: only
+    the first render for a given URL pays for the Reed-Solomon encode and
+    PNG serialization. Entries for deleted rooms are harmless (the room
+    endpoints 404 before the QR is ever requested again) and age out of
+    the LRU once the cache fills.
+
+    segno computes the QR matrix; scaling, bit-packing and the 1-bit
+    greyscale PNG encode go through numpy + pypng, which deflates a
+    bit-packed buffer instead of segno's row-by-row writer and halves
+    the cold render time at identical output size.
+    """
+    matrix = np.array(segno.make(url, error="l").matrix, dtype=np.uint8)
+    matrix = np.repeat(np.repeat(matrix, QR_SCALE, 0), QR_SCALE, 1)
+    matrix = np.pad(matrix, QR_BORDER * QR_SCALE, constant_values=0)
+    # 1-bit greyscale: 0 is black, so dark modules (1 in the matrix) flip.
+    matrix = 1 - matrix
+    buffer = io.BytesIO()
+    writer = png.Writer(
+        width=matrix.shape[1],
+        height=matrix.shape[0],
+        greyscale=True,
+        bitdepth=1,
+    )
+    writer.write_packed(buffer, np.packbits(matrix, axis=1))
+    return buffer.getvalue()
+
+
+def _export_qr_file(room_id: str, viewer_url: str) -> None:
+    with open(os.path.join(QR_EXPORT_DIR, f"{room_id}.png"), "wb") as f:
+        f.write(generate_qr_code(viewer_url))
+
+
+def _remove_qr_file(room_id: str) -> None:
+    try:
+        os.remove(os.path.join(QR_EXPORT_DIR, f"{room_id}.png"))
+    except FileNotFoundError:
+        pass
+
+
+@app.get("/")
+async def root():
+    return {
+        "status": "ok",
+        "rooms": len(rooms_db),
+        "active_streams": active_count,
+    }
+
+
+@app.post("/api/rooms", response_model=RoomResponse)
+async def create_room(payload: RoomCreate):
+    room_id, stream_key = _id_pool.popleft() if _id_pool else _new_credentials()
+    room = Room(
+        room_id=room_id,
+        name=payload.name,
+        stream_key=stream_key,
+        rtmp_url=RTMP_URL,
+        viewer_url=f"{BASE_VIEWER_URL}/{room_id}",
+        qr_code=(
+            f"{QR_PUBLIC_BASE}/{room_id}.png"
+            if QR_EXPORT_DIR
+            else f"/api/rooms/{room_id}/qr.png"
+        ),
+        created_at=datetime.now(timezone.utc),
+    )
+    rooms_db[room_id] = room
+    stream_key_index[stream_key] = room
+    if QR_EXPORT_DIR:
+        await anyio.to_thread.run_sync(_export_qr_file, room_id, room.viewer_url)
+    _invalidate_rooms_list()
+    await _persist_room(room)
+    return room
+
+
+def _invalidate_rooms_list() -> None:
+    global _rooms_list_cache
+    _rooms_list_cache = None
+
+
+def _build_rooms_list() -> bytes:
+    global _rooms_list_cache
+    _rooms_list_cache = orjson.dumps(
+        [
+            {
+                "room_id": r.room_id,
+                "name": r.name,
+                "is_active": r.is_active,
+                "viewer_count": r.viewer_count,
+            }
+            for r in rooms_db.values()
+        ]
+    )
+    return _rooms_list_cache
+
+
+@app.get("/api/rooms")
+async def list_rooms():
+    return Response(
+        content=_rooms_list_cache or _build_rooms_list(),
+        media_type="application/json",
+    )
+
+
+@app.get("/api/rooms/{room_id}", response_model=RoomResponse)
+async def get_room(room_id: str):
+    if not _UUID_RE.fullmatch(room_id):
+        raise HTTPException(status_code=404, detail="Room not found")
+    room = rooms_db.get(room_id)
+    if room is None:
+        raise HTTPException(status_code=404, detail="Room not found")
+    return room
+
+
+@app.get("/api/rooms/{room_id}/qr.png")
+async def get_room_qr(room_id: str):
+    if not _UUID_RE.fullmatch(room_id):
+        raise HTTPException(status_code=404, detail="Room not found")
+    room = rooms_db.get(room_id)
+    if room is None:
+        raise HTTPException(status_code=404, detail="Room not found")
+
+    # Rendering a QR takes several milliseconds of pure CPU; run it on a
+    # worker thread so a cold cache miss never stalls the event loop. On
+    # cache hits the thread hop costs microseconds.
+    png_bytes = await anyio.to_thread.run_sync(generate_qr_code, room.viewer_url)
+    return Response(
+        content=png_bytes,
+        media_type="image/png",
+        # A room's viewer URL never changes, so browsers can cache forever.
+        headers={"Cache-Control": "public, max-age=31536000, immutable"},
+    )
+
+
+@app.delete("/api/rooms/{room_id}")
+async def delete_room(room_id: str):
+    global active_count
+    if not _UUID_RE.fullmatch(room_id):
+        raise HTTPException(status_code=404, detail="Room not found")
+    room = rooms_db.pop(room_id, None)
+    if room is None:
+        raise HTTPException(status_code=404, detail="Room not found")
+    if room.is_active:
+        active_count -= 1
+    stream_key_index.pop(room.stream_key, None)
+    active_streams.pop(room.stream_key, None)
+    if QR_EXPORT_DIR:
+        await anyio.to_thread.run_sync(_remove_qr_file, room_id)
+    _invalidate_rooms_list()
+    await _persist_room_delete(room)
+    return {"status": "deleted", "room_id": room_id}
+
+
+@app.get("/api/rooms/{room_id}/stream-url")
+async def get_room_stream_url(room_id: str):
+    if not _UUID_RE.fullmatch(room_id):
+        raise HTTPException(status_code=404, detail="Room not found")
+    room = rooms_db.get(room_id)
+    if room is None:
+        raise HTTPException(status_code=404, detail="Room not found")
+
+    return {"rtmp_url": room.rtmp_url, "stream_key": room.stream_key}
+
+
+@app.get("/api/rooms/{room_id}/status")
+async def get_stream_status(room_id: str):
+    if not _UUID_RE.fullmatch(room_id):
+        raise HTTPException(status_code=404, detail="Room not found")
+    room = rooms_db.get(room_id)
+    if room is None:
+        raise HTTPException(status_code=404, detail="Room not found")
+
+    uptime_seconds = None
+    if room.is_active and room.stream_key in active_streams:
+        uptime_seconds = time.monotonic() - active_streams[room.stream_key]
+    return {
+        "room_id": room_id,
+        "is_active": room.is_active,
+        "uptime_seconds": uptime_seconds,
+    }
+
+
+async def _handle_stream_start(name: str) -> None:
+    global active_count
+    room = stream_key_index.get(name)
+    if room is not None:
+        if not room.is_active:
+            active_count += 1
+        room.is_active = True
+        active_streams[name] = time.monotonic()
+        _invalidate_rooms_list()
+        await _persist_room(room)
+        await _persist_stream_start(name, datetime.now(timezone.utc))
+
+
+async def _handle_stream_end(name: str) -> None:
+    global active_count
+    room = stream_key_index.get(name)
+    if room is not None:
+        if room.is_active:
+            active_count -= 1
+        room.is_active = False
+        active_streams.pop(name, None)
+        _invalidate_rooms_list()
+        await _persist_room(room)
+        await _persist_stream_end(name)
+
+
+@app.post("/webhooks/stream_start")
+async def stream_start_webhook(name: str = Form(...)):
+    await _handle_stream_start(name)
+    return STATUS_OK
+
+
+@app.post("/webhooks/stream_end")
+async def stream_end_webhook(name: str = Form(...)):
+    await _handle_stream_end(name)
+    return STATUS_OK
+
+
+@app.post("/webhooks/viewer_start")
+async def viewer_start_webhook(room_id: str = Form(...)):
+    room = rooms_db.get(room_id)
+    if room is not None:
+        room.viewer_count += 1
+        _invalidate_rooms_list()
+        await _persist_room(room)
+    return STATUS_OK
+
+
+@app.post("/webhooks/viewer_end")
+async def viewer_end_webhook(room_id: str = Form(...)):
+    room = rooms_db.get(room_id)
+    if room is not None and room.viewer_count > 0:
+        room.viewer_count -= 1
+        _invalidate_rooms_list()
+        await _persist_room(room)
+    return STATUS_OK
+
+
+async def _send_json(send, body: bytes) -> None:
+    await send(
+        {
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _read_body(receive) -> bytes:
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+def _form_field(body: bytes, field: str) -> Optional[str]:
+    values = urllib.parse.parse_qs(body.decode("latin-1")).get(field)
+    return values[0] if values else None
+
+
+async def _fast_root(scope, receive, send) -> None:
+    await _send_json(
+        send,
+        orjson.dumps(
+            {
+                "status": "ok",
+                "rooms": len(rooms_db),
+                "active_streams": active_count,
+            }
+        ),
+    )
+
+
+async def _fast_stream_start(scope, receive, send) -> None:
+    name = _form_field(await _read_body(receive), "name")
+    if name:
+        await _handle_stream_start(name)
+    await _send_json(send, b'{"status":"ok"}')
+
+
+async def _fast_stream_end(scope, receive, send) -> None:
+    name = _form_field(await _read_body(receive), "name")
+    if name:
+        await _handle_stream_end(name)
+    await _send_json(send, b'{"status":"ok"}')
+
+
+class FastPathRouter:
+    """Exact-match dispatch for the highest-traffic fixed routes.
+
+    Health probes and the NGINX webhooks fire constantly and need none of
+    FastAPI's routing, dependency or validation machinery. A single dict
+    lookup on (method, path) hands them to raw ASGI handlers; everything
+    else falls through to the FastAPI app unchanged. The fast handlers
+    also skip the CORS shim, which neither probes nor server-to-server
+    callbacks need.
+    """
+
+    _routes = {
+        ("GET", "/"): _fast_root,
+        ("POST", "/webhooks/stream_start"): _fast_stream_start,
+        ("POST", "/webhooks/stream_end"): _fast_stream_end,
+    }
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            handler = self._routes.get((scope["method"], scope["path"]))
+            if handler is not None:
+                await handler(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+
+# ASGI entry point: fast-path router in front, FastAPI app underneath.
+application = FastPathRouter(app)
+
+
+if __name__ == "__main__":
+    # Pin the Cython event loop and C HTTP parser rather than relying on
+    # uvicorn's auto-detection, and skip access logging on the hot
+    # endpoints (NGINX in front already logs requests). More than one
+    # worker needs read-through Redis state; keep the default at 1 until
+    # then.
+    uvicorn.run(
+        "main:application",
+        host="0.0.0.0",
+        port=HTTP_PORT,
+        loop="uvloop",
+        http="httptools",
+        workers=int(os.environ.get("WEB_CONCURRENCY", "1")),
+        access_log=False,
+    )